@@ -1,15 +1,30 @@
 # ==============================================================================
 # AI Logo Spark: Your Personal Design Assistant
-# Version: 1.1 (Stable - DALL-E 3 API Fix)
+# Version: 1.2 (Parallel DALL-E 3 Requests)
 #
-# This version corrects the API call to DALL-E 3. The model now only accepts
-# n=1 (one image per request). This code has been updated to make four
-# separate requests to generate the four logo concepts.
+# DALL-E 3 only accepts n=1, so four separate requests are needed for the four
+# logo concepts. This version fires all four requests concurrently with the
+# async OpenAI client, so total wait time is roughly one API call instead of
+# four back-to-back.
 # ==============================================================================
 
+import asyncio
+import hashlib
+import io
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import diskcache
 import streamlit as st
-import openai
 import requests # Need this for the download button
+from openai import AsyncOpenAI, OpenAI
+from requests.adapters import HTTPAdapter
+
+from logo_core import create_logo_prompt, generate_all, make_http_client, make_throttle, variation_prompt
 
 # ==============================================================================
 # 1. PAGE CONFIGURATION & API KEY MANAGEMENT
@@ -22,55 +37,235 @@ st.set_page_config(
 )
 
 # Securely load the OpenAI API key from Streamlit's secrets management
-try:
-    openai.api_key = st.secrets["OPENAI_API_KEY"]
-except KeyError:
+if "OPENAI_API_KEY" not in st.secrets:
     st.error("OpenAI API Key not found. Please add it to your Streamlit secrets.", icon="🚨")
     st.stop()
 
+# Clients and connection pools are expensive to build and should be shared
+# across reruns (and users), so they are cache_resource singletons rather
+# than being re-created every time the script re-executes.
+
+@st.cache_resource
+def get_openai():
+    """The async OpenAI client (with its HTTP/2 pool), built exactly once."""
+    return AsyncOpenAI(api_key=st.secrets["OPENAI_API_KEY"], http_client=get_http_client())
+
+@st.cache_resource
+def get_http_client():
+    """The shared httpx pool, also used directly for PNG prefetches."""
+    return make_http_client()
+
+@st.cache_resource
+def get_openai_sync():
+    """The blocking client used for Batch API submissions and polling."""
+    return OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
+
+@st.cache_resource
+def get_session():
+    """One requests.Session with a sized pool for the fallback PNG fetches."""
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=16))
+    return session
+
+@st.cache_resource
+def get_throttle(max_concurrency, max_rpm):
+    """One semaphore + RPM token bucket per sidebar setting, shared by every
+    submit and session so the budget actually spans them; a fresh pair per
+    call would admit each batch at full burst regardless of the limits."""
+    return make_throttle(max_concurrency, max_rpm)
+
 # ==============================================================================
-# 2. AI PROMPT ENGINEERING FOR LOGO DESIGN
+# 2. GENERATION ORCHESTRATION (prompt engineering lives in logo_core.py)
 # ==============================================================================
 
-def create_logo_prompt(company_description, logo_style, color_palette):
-    """Engineers a detailed prompt for the DALL-E 3 model."""
-    base_prompt = (
-        f"A modern, clean, vector logo for a company. "
-        f"The company is: '{company_description}'. "
-        f"The logo style should be: '{logo_style}'. "
-        f"Use the color palette: '{color_palette}'. "
-        "The logo should be on a clean, solid white background, suitable for branding. "
-        "The design must be simple, memorable, and professional. "
-        "Avoid 3D rendering and complex text. The logo should be iconic."
+@st.cache_resource
+def get_event_loop():
+    """One long-lived asyncio loop on a daemon thread, shared by every rerun.
+
+    Running the API calls here instead of asyncio.run on the script thread
+    keeps Streamlit's render loop free, so spinners and toasts stay live
+    while the images generate.
+    """
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return loop
+
+class IncompleteBatchError(Exception):
+    """Raised instead of returning a failed or partial batch so st.cache_data
+    never stores it; carries the index-aligned URLs for rendering."""
+
+    def __init__(self, image_urls):
+        failed = sum(url is None for url in image_urls)
+        super().__init__(f"{failed} of {len(image_urls)} concepts failed")
+        self.image_urls = image_urls
+
+# --- THIS FUNCTION NOW RUNS ALL REQUESTS IN PARALLEL ---
+# Cached so re-submitting the exact same brief (or a widget-click rerun) is
+# served from memory instead of re-billing 4 DALL-E calls. DALL-E URLs expire
+# after ~1 hour, so the cache entries do too. Only complete batches are
+# cached: errors propagate as exceptions, which st.cache_data never stores,
+# so a transient 429 burst doesn't pin a bad result to the prompt for an hour.
+@st.cache_data(ttl=3600, max_entries=128, show_spinner=False)
+def generate_logo_concepts(prompt, num_images=4, _placeholders=None,
+                           _max_concurrency=5, _max_rpm=5):
+    """Calls the OpenAI DALL-E 3 API multiple times, concurrently, to generate concepts.
+
+    If `_placeholders` (a list of st.empty slots, excluded from the cache key)
+    is given, each concept is rendered the moment its request finishes, so the
+    first logo appears after ~one API call instead of after the slowest of four.
+    `_max_concurrency` and `_max_rpm` throttle the parallel calls to the
+    operator's OpenAI tier so a burst of submits doesn't 429 the whole batch.
+    """
+
+    # logo_core.generate_all runs on the background loop thread, so it must
+    # not touch st.* itself; finished concepts are handed back through this
+    # queue and rendered from the script thread below.
+    results = queue.Queue()
+
+    def _drain():
+        while True:
+            try:
+                kind, *payload = results.get_nowait()
+            except queue.Empty:
+                return
+            if kind == "error":
+                st.warning(f"One concept failed after retries: {payload[0]}", icon="⚠️")
+            elif kind == "bytes":
+                # A background prefetch finished; seed the disk cache so
+                # the download buttons render without refetching.
+                store_bytes(*payload)
+            elif _placeholders:
+                index, url = payload
+                _placeholders[index].image(url, caption=f"Concept #{index+1}", use_column_width=True)
+
+    st.toast(f"Generating {num_images} concepts in parallel...")
+    future = asyncio.run_coroutine_threadsafe(
+        generate_all(
+            prompt, get_openai(), get_http_client(), num_images=num_images,
+            throttle=get_throttle(_max_concurrency, _max_rpm),
+            on_result=lambda index, payload: results.put(
+                ("error", payload) if index == "error" else ("concept", index, payload)),
+            on_bytes=lambda url, png_bytes: results.put(("bytes", url, png_bytes)),
+        ),
+        get_event_loop(),
     )
-    return base_prompt
+    # Poll from the script thread so Streamlit keeps rendering while
+    # the background loop does the waiting.
+    while not future.done():
+        _drain()
+        time.sleep(0.2)
+    _drain()
+    image_urls = future.result()
+    if any(url is None for url in image_urls):
+        raise IncompleteBatchError(image_urls)
+    return image_urls
+
+@st.cache_resource
+def get_download_pool():
+    """One pool for the parallel fallback PNG fetches at render time."""
+    return ThreadPoolExecutor(max_workers=4)
 
-# --- THIS FUNCTION IS NOW CORRECTED ---
-def generate_logo_concepts(prompt, num_images=4):
-    """Calls the OpenAI DALL-E 3 API multiple times to generate concepts."""
-    image_urls = []
+@st.cache_resource
+def get_png_cache():
+    """The on-disk PNG store, so bytes survive not just widget-click reruns
+    but process restarts, for the ~1 hour before the DALL-E URLs expire."""
+    return diskcache.Cache("/tmp/logo_png_cache", size_limit=500_000_000)
+
+def fetch_bytes(url):
+    """Downloads one generated PNG, cached on disk across reruns and restarts."""
+    key = hashlib.sha256(url.encode()).digest()
+    cached = get_png_cache().get(key)
+    if cached is not None:
+        return cached
     try:
-        # Loop to make multiple requests, since n must be 1
-        for i in range(num_images):
-            st.toast(f"Generating concept #{i+1}...")
-            response = openai.images.generate(
-                model="dall-e-3",
-                prompt=prompt,
-                n=1,  # Generate 1 image at a time
-                size="1024x1024",
-                quality="standard",
-            )
-            # Add the URL of the single generated image to our list
-            image_urls.append(response.data[0].url)
-        return image_urls
-    except Exception as e:
-        st.error(f"An error occurred while generating images: {e}", icon="🔥")
+        # An expired or flagged URL returns an error body; never cache that
+        # as PNG bytes or the download button serves it for the rest of the TTL
+        response = get_session().get(url, timeout=30)
+        response.raise_for_status()
+        content = response.content
+    except Exception:
         return None
+    get_png_cache().set(key, content, expire=3600)
+    return content
+
+def store_bytes(url, content):
+    """Seeds the disk cache with PNG bytes prefetched during generation."""
+    get_png_cache().set(hashlib.sha256(url.encode()).digest(), content, expire=3600)
+
+# --- BATCH MODE (OpenAI Batch API: half price, up to 24h turnaround) ---
+
+def submit_logo_batch(prompt, num_images=4):
+    """Submits the concept requests as a Batch API job and returns its id."""
+    lines = []
+    for i in range(num_images):
+        lines.append(json.dumps({
+            "custom_id": f"concept-{i+1}",
+            "method": "POST",
+            "url": "/v1/images/generations",
+            "body": {
+                "model": "dall-e-3",
+                "prompt": variation_prompt(prompt, i, num_images),
+                "n": 1,
+                "size": "1024x1024",
+                "quality": "standard",
+            },
+        }))
+    jsonl = io.BytesIO("\n".join(lines).encode("utf-8"))
+    jsonl.name = "logo_batch.jsonl"
+    client = get_openai_sync()
+    batch_file = client.files.create(file=jsonl, purpose="batch")
+    batch = client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint="/v1/images/generations",
+        completion_window="24h",
+    )
+    return batch.id
+
+def check_logo_batch(batch_id):
+    """Polls a batch job. Returns (status, image_urls or None).
+
+    The output file's line order is not guaranteed to match the input, so
+    each row is placed by the index encoded in its custom_id; rows that
+    failed leave a None hole, matching the live path's partial results.
+    """
+    client = get_openai_sync()
+    batch = client.batches.retrieve(batch_id)
+    if batch.status != "completed" or not batch.output_file_id:
+        return batch.status, None
+    output = client.files.content(batch.output_file_id)
+    slots = {}
+    for line in output.text.splitlines():
+        if not line.strip():
+            continue
+        result = json.loads(line)
+        index = int(result["custom_id"].rsplit("-", 1)[1]) - 1
+        response = result.get("response") or {}
+        if response.get("status_code") == 200:
+            slots[index] = response["body"]["data"][0]["url"]
+        else:
+            slots[index] = None
+    if not slots:
+        return batch.status, []
+    image_urls = [slots.get(i) for i in range(max(slots) + 1)]
+    return batch.status, image_urls
 
 # ==============================================================================
 # 3. STREAMLIT UI (The Frontend)
 # ==============================================================================
 
+# Operators can match these to their OpenAI tier; defaults come from the
+# environment so deployments can be tuned without touching the code.
+with st.sidebar:
+    st.header("API Limits")
+    max_concurrency = st.number_input(
+        "Max concurrent requests", min_value=1, max_value=16,
+        value=int(os.environ.get("DALLE_CONCURRENCY", "5")),
+    )
+    max_rpm = st.number_input(
+        "Max requests per minute", min_value=1, max_value=500,
+        value=int(os.environ.get("DALLE_RPM", "5")),
+    )
+
 st.title("AI Logo Spark 🎨✨")
 st.write("Turn your ideas into professional logo concepts in seconds. Describe your business and let AI do the rest.")
 st.divider()
@@ -92,29 +287,94 @@ with st.form(key="logo_form"):
         placeholder="e.g., Earthy tones like brown, green, and beige"
     )
 
+    batch_mode = st.checkbox(
+        "Batch mode (half price, results within 24 hours)",
+        help="Submits the job to OpenAI's Batch API instead of generating live."
+    )
+
     submit_button = st.form_submit_button(label="Spark My Logos!", use_container_width=True)
 
+def make_concept_placeholders():
+    """Creates the results header plus one st.empty slot per column."""
+    st.divider()
+    st.subheader("Here Are Your AI-Generated Logo Concepts!")
+    cols = st.columns(4)
+    return cols, [col.empty() for col in cols]
+
+def display_logo_concepts(logo_urls, cols=None, placeholders=None):
+    """Fills the concept columns with images and download buttons.
+
+    `logo_urls` is index-aligned with the columns; a None slot means that
+    concept failed, so its placeholder is cleared rather than the survivors
+    being compacted into the wrong columns.
+    """
+    if cols is None:
+        cols, placeholders = make_concept_placeholders()
+
+    # Bytes prefetched during generation are already in the disk cache, so
+    # this usually never touches the network; cache hits and the batch path
+    # still fetch in parallel.
+    contents = list(get_download_pool().map(lambda url: fetch_bytes(url) if url else None, logo_urls))
+
+    for i, url in enumerate(logo_urls):
+        if url is None:
+            placeholders[i % 4].empty()
+            continue
+        # Re-render in the placeholder: a no-op visually if the streaming
+        # path already filled it, and the only render on a cache hit.
+        placeholders[i % 4].image(url, caption=f"Concept #{i+1}", use_column_width=True)
+        with cols[i % 4]:
+            if contents[i] is not None:
+                st.download_button("Download", contents[i], file_name=f"logo_concept_{i+1}.png", mime="image/png")
+            else:
+                st.error("Could not create download link.", icon="⚠️")
+
 if submit_button:
     if not desc_input or not color_input:
         st.warning("Please fill out all the fields to generate your logos.", icon="⚠️")
+    elif batch_mode:
+        final_prompt = create_logo_prompt(desc_input, style_input, color_input)
+        try:
+            st.session_state["batch_id"] = submit_logo_batch(final_prompt)
+            st.success("Batch job submitted! Check back below for your concepts.", icon="📬")
+        except Exception as e:
+            st.error(f"Could not submit the batch job: {e}", icon="🔥")
     else:
-        with st.spinner("Our AI designer is sketching your concepts... This might take up to a minute."):
-            final_prompt = create_logo_prompt(desc_input, style_input, color_input)
-            logo_urls = generate_logo_concepts(final_prompt)
-
-        if logo_urls:
-            st.divider()
-            st.subheader("Here Are Your AI-Generated Logo Concepts!")
-            
-            cols = st.columns(4)
-            for i, url in enumerate(logo_urls):
-                with cols[i % 4]:
-                    st.image(url, caption=f"Concept #{i+1}", use_column_width=True)
-                    try:
-                        # Fetch the image content for the download button
-                        image_content = requests.get(url).content
-                        st.download_button("Download", image_content, file_name=f"logo_concept_{i+1}.png", mime="image/png")
-                    except Exception as e:
-                        st.error("Could not create download link.", icon="⚠️")
+        final_prompt = create_logo_prompt(desc_input, style_input, color_input)
+        cols, placeholders = make_concept_placeholders()
+        with st.spinner("Our AI designer is sketching your concepts... Each appears as soon as it's ready."):
+            try:
+                logo_urls = generate_logo_concepts(
+                    final_prompt, _placeholders=placeholders,
+                    _max_concurrency=max_concurrency, _max_rpm=max_rpm,
+                )
+            except IncompleteBatchError as e:
+                # Render whatever succeeded; the batch just isn't cached
+                logo_urls = e.image_urls
+            except Exception as e:
+                st.error(f"An error occurred while generating images: {e}", icon="🔥")
+                logo_urls = None
+
+        if logo_urls and any(url is not None for url in logo_urls):
+            display_logo_concepts(logo_urls, cols=cols, placeholders=placeholders)
         else:
             st.error("Could not generate logo concepts. The AI may have flagged the prompt, or an API error occurred.", icon="🚨")
+
+# Pending batch jobs survive reruns in session state; let the user poll them.
+if "batch_id" in st.session_state:
+    st.divider()
+    st.info(f"Batch job pending: `{st.session_state['batch_id']}`", icon="⏳")
+    if st.button("Check status"):
+        try:
+            status, logo_urls = check_logo_batch(st.session_state["batch_id"])
+        except Exception as e:
+            st.error(f"Could not check the batch job: {e}", icon="🔥")
+        else:
+            if logo_urls and any(url is not None for url in logo_urls):
+                del st.session_state["batch_id"]
+                display_logo_concepts(logo_urls)
+            elif status == "completed":
+                del st.session_state["batch_id"]
+                st.error("The batch job completed, but none of the concepts succeeded.", icon="🚨")
+            else:
+                st.info(f"Still working... current status: **{status}**", icon="🎨")
@@ -0,0 +1,165 @@
+# ==============================================================================
+# AI Logo Spark: Prompt Engineering & DALL-E Generation Core
+#
+# Everything here is Streamlit-free so it can be imported by tests or by a
+# CLI / batch driver as well as by app.py. The UI layer owns all rendering,
+# caching decorators, and session state.
+# ==============================================================================
+
+import asyncio
+from functools import lru_cache
+
+import httpx
+import openai
+from aiolimiter import AsyncLimiter
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_random_exponential
+
+
+# Built once at import instead of re-concatenating f-strings per call;
+# create_logo_prompt sits on the hot path when batch mode emits one JSONL
+# row per prompt variation.
+_PROMPT_TEMPLATE = (
+    "A modern, clean, vector logo for a company. "
+    "The company is: '{company_description}'. "
+    "The logo style should be: '{logo_style}'. "
+    "Use the color palette: '{color_palette}'. "
+    "The logo should be on a clean, solid white background, suitable for branding. "
+    "The design must be simple, memorable, and professional. "
+    "Avoid 3D rendering and complex text. The logo should be iconic."
+)
+
+
+# One design axis per concept, so the four requests ask for meaningfully
+# different directions instead of relying on random seeds to differ. Only
+# this short suffix varies; the shared base prompt stays a stable key for
+# caching and for Batch API rows.
+VARIATION_AXES = ("iconography", "typographic mark", "negative space", "monogram")
+
+
+def variation_prompt(prompt, index, total):
+    """Appends the per-concept variation hint to the shared base prompt."""
+    axis = VARIATION_AXES[index % len(VARIATION_AXES)]
+    return f"{prompt} Variation {index + 1} of {total}: emphasize {axis}."
+
+
+@lru_cache(maxsize=16)
+def _style_template(logo_style):
+    """Pre-renders the template for one of the UI's fixed style choices."""
+    return _PROMPT_TEMPLATE.replace("{logo_style}", logo_style)
+
+
+def create_logo_prompt(company_description, logo_style, color_palette):
+    """Engineers a detailed prompt for the DALL-E 3 model."""
+    return _style_template(logo_style).format_map({
+        "company_description": company_description,
+        "color_palette": color_palette,
+    })
+
+
+# Transient 429s/timeouts are retried per image with jittered backoff,
+# so one flaky request no longer costs the whole batch.
+@retry(
+    stop=stop_after_attempt(3),
+    wait=wait_random_exponential(min=1, max=20),
+    retry=retry_if_exception_type((openai.RateLimitError, openai.APITimeoutError)),
+    reraise=True,
+)
+async def generate_one(client, prompt):
+    """Generates a single concept and returns its URL (DALL-E 3 only allows n=1)."""
+    response = await client.images.generate(
+        model="dall-e-3",
+        prompt=prompt,
+        n=1,
+        size="1024x1024",
+        quality="standard",
+    )
+    return response.data[0].url
+
+
+def make_throttle(max_concurrency, max_rpm):
+    """Builds the request throttle: a concurrency semaphore plus a token
+    bucket enforcing requests-per-minute.
+
+    Build this once and reuse it across generate_all calls (all work runs on
+    one event loop), so the RPM budget spans rapid re-submits and concurrent
+    sessions instead of resetting with every call.
+    """
+    return asyncio.Semaphore(max_concurrency), AsyncLimiter(max_rate=max_rpm, time_period=60)
+
+
+def make_http_client():
+    """Builds the HTTP/2 client that multiplexes all the API calls and PNG
+    downloads over a single connection per host instead of a TCP+TLS
+    handshake for each."""
+    return httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=8, max_connections=16),
+        timeout=60,
+    )
+
+
+async def generate_all(prompt, client, http_client, num_images=4, throttle=None,
+                       on_result=None, on_bytes=None):
+    """Generates `num_images` concepts concurrently and returns their URLs.
+
+    The returned list is index-aligned with the requested concepts: a slot is
+    None when that concept failed after retries, so callers can keep streamed
+    placeholders and results pointing at the same columns.
+
+    `client` is an AsyncOpenAI instance and `http_client` the shared httpx
+    pool (see make_http_client) used to prefetch the PNGs; both are owned by
+    the caller and are not closed here, so they can be reused across calls.
+    `throttle` is a (semaphore, limiter) pair from make_throttle — pass the
+    same pair to every call so the concurrency and RPM budget is enforced
+    across submits, not per batch. If `on_result` is given it is called with
+    (index, url) the moment each concept lands, or with ("error", exception)
+    when a concept fails after retries. `on_bytes(url, png_bytes)` is called
+    as each background PNG prefetch completes.
+    """
+    if throttle is None:
+        throttle = make_throttle(5, 5)
+    semaphore, limiter = throttle
+
+    async def _prefetch(url):
+        # Runs as its own task over the same multiplexed pool, so the PNG
+        # downloads overlap with the remaining generation calls without
+        # delaying the streamed renders; a failure here is harmless because
+        # the UI re-fetches missing bytes on render.
+        try:
+            response = await http_client.get(url)
+            # Only hand back real PNG bytes: an expired or flagged URL
+            # returns an error body that must not end up in the byte cache
+            if response.status_code == 200 and on_bytes:
+                on_bytes(url, response.content)
+        except Exception:
+            pass
+
+    prefetch_tasks = []
+
+    async def _one(index):
+        async with semaphore, limiter:
+            url = await generate_one(client, variation_prompt(prompt, index, num_images))
+        prefetch_tasks.append(asyncio.create_task(_prefetch(url)))
+        return index, url
+
+    image_urls = [None] * num_images
+    # Fire all requests at once and report each as soon as it lands
+    tasks = [_one(i) for i in range(num_images)]
+    for finished in asyncio.as_completed(tasks):
+        try:
+            index, url = await finished
+        except Exception as e:
+            # Isolate the failure: the other concepts still land
+            if on_result:
+                on_result("error", e)
+            continue
+        image_urls[index] = url
+        if on_result:
+            on_result(index, url)
+    # Let the in-flight downloads finish so the bytes are seeded before the
+    # caller renders the download buttons
+    if prefetch_tasks:
+        await asyncio.gather(*prefetch_tasks, return_exceptions=True)
+    # Partial results are still results: failed slots stay None so the
+    # survivors keep their original columns
+    return image_urls